@@ -5,18 +5,88 @@ Track incidents, alerts, and on-call schedules
 """
 
 import json
+import secrets
 import sqlite3
-import uuid
+from contextlib import contextmanager
 from dataclasses import dataclass, asdict, field
-from datetime import datetime
+from datetime import date, datetime
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Iterator
 import argparse
 
+# Prefer a C-backed JSON library for the hot serialize/deserialize path;
+# fall back to the stdlib when neither is installed.
+try:
+    import orjson
+
+    def _dumps(obj: Any) -> str:
+        return orjson.dumps(obj).decode()
+
+    _loads = orjson.loads
+except ImportError:
+    try:
+        import ujson
+
+        _dumps = ujson.dumps
+        _loads = ujson.loads
+    except ImportError:
+        _dumps = json.dumps
+        _loads = json.loads
+
 
 DB_PATH = Path.home() / ".blackroad" / "incidents.db"
 TEAM = ["alexa", "alice", "octavia", "aria", "shellfish"]
 
+_VALID_STATUSES = frozenset({"new", "investigating", "identified", "monitoring", "resolved"})
+
+# Columns declared JSON round-trip Python lists automatically: the
+# adapter serializes on INSERT, the converter deserializes on SELECT.
+sqlite3.register_adapter(list, _dumps)
+sqlite3.register_converter("JSON", _loads)
+
+# Hot-path SQL as module constants so sqlite3's per-connection statement
+# cache always sees the same string and skips the prepare step.
+_SQL_INSERT_INCIDENT = '''
+    INSERT INTO incidents
+    (id, title, severity, status, assignee, services, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+_SQL_INSERT_ALERT = '''
+    INSERT INTO alerts (id, source, message, severity, fired_at, incident_id)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+_SQL_INSERT_TIMELINE_EVENT = \
+    'INSERT INTO timeline_events (incident_id, ts, author, event) VALUES (?, ?, ?, ?)'
+_SQL_SELECT_TIMELINE = \
+    'SELECT ts, author, event FROM timeline_events WHERE incident_id = ? ORDER BY ts'
+_SQL_INCIDENT_EXISTS = 'SELECT 1 FROM incidents WHERE id = ?'
+_SQL_UPDATE_ASSIGNEE = 'UPDATE incidents SET assignee = ? WHERE id = ?'
+_SQL_UPDATE_STATUS = 'UPDATE incidents SET status = ? WHERE id = ?'
+_SQL_RESOLVE = 'UPDATE incidents SET status = ?, resolved_at = ? WHERE id = ?'
+_SQL_SELECT_ACTIVE = '''
+    SELECT id, title, severity, status, assignee, services, created_at, resolved_at, postmortem
+    FROM incidents WHERE status != 'resolved' ORDER BY created_at DESC
+'''
+_SQL_SELECT_ACTIVE_TIMELINES = '''
+    SELECT te.incident_id, te.ts, te.author, te.event
+    FROM timeline_events te
+    JOIN incidents i ON i.id = te.incident_id
+    WHERE i.status != 'resolved'
+    ORDER BY te.incident_id, te.ts
+'''
+_SQL_SELECT_INCIDENT = '''
+    SELECT id, title, severity, status, assignee, services, created_at, resolved_at, postmortem
+    FROM incidents WHERE id = ?
+'''
+
+
+@lru_cache(maxsize=1)
+def _oncall_for_day(day_ordinal: int) -> str:
+    """Resolve the on-call person for a day; cached until the day changes"""
+    day_of_week = date.fromordinal(day_ordinal).weekday()
+    return TEAM[day_of_week % len(TEAM)]
+
 
 @dataclass
 class Alert:
@@ -43,6 +113,23 @@ class Incident:
     resolved_at: Optional[str] = None
     postmortem: str = ""
 
+    @classmethod
+    def _from_row(cls, row: sqlite3.Row, timeline: List[Dict[str, str]] = None) -> "Incident":
+        """Build an Incident from an incidents table row"""
+        services = row["services"]
+        if isinstance(services, (str, bytes)):
+            # Legacy databases declare the column TEXT, so the JSON
+            # converter never fires; decode the raw value here.
+            services = _loads(services)
+        return cls(
+            id=row["id"], title=row["title"], severity=row["severity"],
+            status=row["status"], assignee=row["assignee"],
+            services=services,
+            timeline=timeline if timeline is not None else [],
+            created_at=row["created_at"], resolved_at=row["resolved_at"],
+            postmortem=row["postmortem"] or ""
+        )
+
 
 class IncidentManager:
     """Incident Response and On-Call Management"""
@@ -50,13 +137,32 @@ class IncidentManager:
     def __init__(self):
         """Initialize manager with database"""
         DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(DB_PATH, isolation_level=None,
+                                     check_same_thread=False, cached_statements=256,
+                                     detect_types=sqlite3.PARSE_DECLTYPES)
+        self._conn.row_factory = sqlite3.Row
         self._init_db()
-    
+
+    def _cursor(self) -> sqlite3.Cursor:
+        """Get a cursor on the shared connection"""
+        return self._conn.cursor()
+
+    def close(self):
+        """Close the database connection"""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
     def _init_db(self):
-        """Initialize SQLite database schema"""
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
+        """Initialize SQLite database schema and tuning PRAGMAs"""
+        cursor = self._cursor()
+
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS incidents (
                 id TEXT PRIMARY KEY,
@@ -64,8 +170,7 @@ class IncidentManager:
                 severity TEXT,
                 status TEXT,
                 assignee TEXT,
-                services TEXT,
-                timeline TEXT,
+                services JSON,
                 created_at TEXT,
                 resolved_at TEXT,
                 postmortem TEXT
@@ -83,182 +188,298 @@ class IncidentManager:
                 FOREIGN KEY(incident_id) REFERENCES incidents(id)
             )
         ''')
-        
-        conn.commit()
-        conn.close()
-    
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS timeline_events (
+                incident_id TEXT,
+                ts TEXT,
+                author TEXT,
+                event TEXT,
+                FOREIGN KEY(incident_id) REFERENCES incidents(id)
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_timeline_incident
+            ON timeline_events(incident_id, ts)
+        ''')
+
+        self._migrate_legacy_timeline(cursor)
+
+        # ANALYZE scans every index, so only pay for it the one time the
+        # indexes are actually built, not on every construction.
+        fresh_indexes = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_inc_status_created'"
+        ).fetchone() is None
+        self._create_indexes(cursor)
+        if fresh_indexes:
+            cursor.execute('ANALYZE')
+
+        # WAL halves the fsyncs per write and lets readers run alongside
+        # a writer; the rest trade a little crash-recovery work for speed.
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute('PRAGMA temp_store=MEMORY')
+        cursor.execute('PRAGMA cache_size=-64000')
+        cursor.execute('PRAGMA mmap_size=268435456')
+
+    @staticmethod
+    def _migrate_legacy_timeline(cursor: sqlite3.Cursor):
+        """Copy timeline JSON from the pre-normalization schema into timeline_events
+
+        Databases created before timelines moved to the child table keep
+        their history in an incidents.timeline JSON column. Parse each
+        blob into timeline_events once, then drop the column (or NULL it
+        out on SQLite builds without DROP COLUMN) so the migration never
+        re-runs.
+        """
+        columns = [r["name"] for r in cursor.execute("PRAGMA table_info('incidents')")]
+        if "timeline" not in columns:
+            return
+
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            rows = cursor.execute(
+                "SELECT id, timeline FROM incidents WHERE timeline IS NOT NULL"
+            ).fetchall()
+            for incident_id, timeline_json in rows:
+                for event in _loads(timeline_json):
+                    cursor.execute(_SQL_INSERT_TIMELINE_EVENT,
+                                   (incident_id, event.get("timestamp", ""),
+                                    event.get("author", ""), event.get("event", "")))
+            cursor.execute('UPDATE incidents SET timeline = NULL')
+            cursor.execute('COMMIT')
+        except Exception:
+            cursor.execute('ROLLBACK')
+            raise
+
+        try:
+            cursor.execute('ALTER TABLE incidents DROP COLUMN timeline')
+        except sqlite3.OperationalError:
+            pass
+
+    @staticmethod
+    def _create_indexes(cursor: sqlite3.Cursor):
+        """Create the incidents query indexes"""
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_inc_status_created
+            ON incidents(status, created_at DESC)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_inc_status_sev
+            ON incidents(status, severity)
+        ''')
+        # Partial index over just the unresolved rows; stays tiny no
+        # matter how much resolved history accumulates. The active-list
+        # query still fetches services/resolved_at/postmortem from the
+        # table, so this narrows the scan rather than fully covering it.
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_active
+            ON incidents(created_at DESC, id, title, severity, status, assignee)
+            WHERE status != 'resolved'
+        ''')
+
+    @contextmanager
+    def bulk_load(self):
+        """Speed up one-shot bulk imports at the cost of durability
+
+        Turns off synchronous writes and drops the incidents indexes for
+        the duration of the block, then rebuilds the indexes, restores
+        synchronous=NORMAL, and re-runs ANALYZE. A crash inside the
+        block can lose the imported rows, so only use this for
+        migrations and restores that can be re-run.
+        """
+        cursor = self._cursor()
+        cursor.execute('PRAGMA synchronous=OFF')
+        cursor.execute('DROP INDEX IF EXISTS idx_inc_status_created')
+        cursor.execute('DROP INDEX IF EXISTS idx_inc_status_sev')
+        cursor.execute('DROP INDEX IF EXISTS idx_active')
+        try:
+            yield
+        finally:
+            self._create_indexes(cursor)
+            cursor.execute('PRAGMA synchronous=NORMAL')
+            cursor.execute('ANALYZE')
+
     def create_incident(self, title: str, severity: str, services: List[str] = None) -> Incident:
         """Create a new incident"""
-        incident_id = str(uuid.uuid4())[:8]
+        return self.create_incidents([{
+            "title": title,
+            "severity": severity,
+            "services": services,
+        }])[0]
+
+    def create_incidents(self, specs: List[Dict[str, Any]]) -> List[Incident]:
+        """Create many incidents in one transaction
+
+        Each spec is a dict with 'title', 'severity', and optionally
+        'services'. All rows are inserted with a single executemany so a
+        bulk alert storm pays one fsync instead of one per incident.
+        """
         now = datetime.now().isoformat()
         assignee = self.oncall_schedule()
-        services = services or []
-        
-        incident = Incident(
-            id=incident_id,
-            title=title,
-            severity=severity,
-            status="new",
-            assignee=assignee,
-            services=services,
-            timeline=[],
-            created_at=now
-        )
-        
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO incidents 
-            (id, title, severity, status, assignee, services, timeline, created_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (incident.id, incident.title, incident.severity, incident.status,
-              incident.assignee, json.dumps(incident.services), 
-              json.dumps(incident.timeline), incident.created_at))
-        conn.commit()
-        conn.close()
-        
-        return incident
+
+        cursor = self._cursor()
+        # 12-hex-char ids (48 bits) keep collisions vanishingly rare even
+        # at bulk-import scale; the retry is a safety net for the
+        # remaining PRIMARY KEY races, not an expected path.
+        for _ in range(3):
+            incidents = [
+                Incident(
+                    id=secrets.token_hex(6),
+                    title=spec["title"],
+                    severity=spec["severity"],
+                    status="new",
+                    assignee=assignee,
+                    services=spec.get("services") or [],
+                    timeline=[],
+                    created_at=now
+                )
+                for spec in specs
+            ]
+
+            own_txn = not self._conn.in_transaction
+            if own_txn:
+                cursor.execute('BEGIN')
+            try:
+                cursor.executemany(_SQL_INSERT_INCIDENT, [
+                    (inc.id, inc.title, inc.severity, inc.status, inc.assignee,
+                     inc.services, inc.created_at)
+                    for inc in incidents
+                ])
+                if own_txn:
+                    cursor.execute('COMMIT')
+                return incidents
+            except sqlite3.IntegrityError:
+                if own_txn:
+                    cursor.execute('ROLLBACK')
+                    continue
+                raise
+            except Exception:
+                if own_txn:
+                    cursor.execute('ROLLBACK')
+                raise
+
+        raise sqlite3.IntegrityError("could not generate unique incident ids")
     
     def assign(self, incident_id: str, assignee: str) -> bool:
         """Assign incident to person"""
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute('UPDATE incidents SET assignee = ? WHERE id = ?', (assignee, incident_id))
-        conn.commit()
-        conn.close()
+        cursor = self._cursor()
+        cursor.execute(_SQL_UPDATE_ASSIGNEE, (assignee, incident_id))
         return cursor.rowcount > 0
     
     def update_status(self, incident_id: str, status: str) -> bool:
         """Update incident status"""
-        valid_statuses = ["new", "investigating", "identified", "monitoring", "resolved"]
-        if status not in valid_statuses:
+        if status not in _VALID_STATUSES:
             return False
-        
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute('UPDATE incidents SET status = ? WHERE id = ?', (status, incident_id))
-        conn.commit()
-        conn.close()
+
+        cursor = self._cursor()
+        cursor.execute(_SQL_UPDATE_STATUS, (status, incident_id))
         return cursor.rowcount > 0
     
     def add_timeline_event(self, incident_id: str, event: str, author: str) -> bool:
         """Add timestamped event to timeline"""
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT timeline FROM incidents WHERE id = ?', (incident_id,))
-        row = cursor.fetchone()
-        if not row:
-            conn.close()
+        cursor = self._cursor()
+
+        cursor.execute(_SQL_INCIDENT_EXISTS, (incident_id,))
+        if not cursor.fetchone():
             return False
-        
-        timeline = json.loads(row[0])
-        timeline.append({
-            "timestamp": datetime.now().isoformat(),
-            "event": event,
-            "author": author
-        })
-        
-        cursor.execute('UPDATE incidents SET timeline = ? WHERE id = ?',
-                      (json.dumps(timeline), incident_id))
-        conn.commit()
-        conn.close()
+
+        cursor.execute(
+            _SQL_INSERT_TIMELINE_EVENT,
+            (incident_id, datetime.now().isoformat(), author, event)
+        )
         return True
+
+    def _fetch_timeline(self, incident_id: str) -> List[Dict[str, str]]:
+        """Fetch an incident's timeline events ordered by timestamp"""
+        cursor = self._cursor()
+        cursor.execute(_SQL_SELECT_TIMELINE, (incident_id,))
+        return [
+            {"timestamp": ts, "event": event, "author": author}
+            for ts, author, event in cursor.fetchall()
+        ]
     
     def resolve(self, incident_id: str, resolution_notes: str = "") -> bool:
         """Resolve incident"""
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
+        cursor = self._cursor()
         now = datetime.now().isoformat()
-        
-        cursor.execute(
-            'UPDATE incidents SET status = ?, resolved_at = ? WHERE id = ?',
-            ("resolved", now, incident_id)
-        )
-        conn.commit()
-        conn.close()
+
+        cursor.execute(_SQL_RESOLVE, ("resolved", now, incident_id))
         return cursor.rowcount > 0
     
     def get_mttr(self, severity: Optional[str] = None) -> float:
         """Get mean time to resolve in minutes"""
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
+        cursor = self._cursor()
+
         if severity:
             cursor.execute(
                 '''SELECT AVG(
-                    (strftime('%s', resolved_at) - strftime('%s', created_at)) / 60.0
-                  ) FROM incidents 
+                    (julianday(resolved_at) - julianday(created_at)) * 1440.0
+                  ) FROM incidents
                    WHERE status = 'resolved' AND severity = ?''',
                 (severity,)
             )
         else:
             cursor.execute(
                 '''SELECT AVG(
-                    (strftime('%s', resolved_at) - strftime('%s', created_at)) / 60.0
-                  ) FROM incidents 
+                    (julianday(resolved_at) - julianday(created_at)) * 1440.0
+                  ) FROM incidents
                    WHERE status = 'resolved' '''
             )
         
         row = cursor.fetchone()
-        conn.close()
         return row[0] or 0
     
-    def get_active_incidents(self) -> List[Incident]:
-        """Get active incidents"""
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute(
-            '''SELECT id, title, severity, status, assignee, services, timeline, created_at, resolved_at, postmortem
-               FROM incidents WHERE status != 'resolved' ORDER BY created_at DESC'''
-        )
-        rows = cursor.fetchall()
-        conn.close()
-        
-        return [
-            Incident(
-                id=row[0], title=row[1], severity=row[2], status=row[3],
-                assignee=row[4], services=json.loads(row[5]),
-                timeline=json.loads(row[6]), created_at=row[7],
-                resolved_at=row[8], postmortem=row[9] or ""
+    def get_active_incidents(self) -> Iterator[Incident]:
+        """Yield active incidents, newest first"""
+        # One joined query for all active timelines instead of one
+        # _fetch_timeline round trip per incident.
+        timelines: Dict[str, List[Dict[str, str]]] = {}
+        cursor = self._cursor()
+        cursor.execute(_SQL_SELECT_ACTIVE_TIMELINES)
+        for incident_id, ts, author, event in cursor:
+            timelines.setdefault(incident_id, []).append(
+                {"timestamp": ts, "event": event, "author": author}
             )
-            for row in rows
-        ]
+
+        cursor.execute(_SQL_SELECT_ACTIVE)
+        for row in cursor:
+            yield Incident._from_row(row, timeline=timelines.get(row["id"], []))
     
     def auto_create_from_alert(self, alert_source: str, message: str, severity: str) -> Incident:
         """Create incident from alert"""
-        incident = self.create_incident(f"Alert: {message}", severity)
-        
-        alert_id = str(uuid.uuid4())[:8]
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO alerts (id, source, message, severity, fired_at, incident_id)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (alert_id, alert_source, message, severity, datetime.now().isoformat(), incident.id))
-        conn.commit()
-        conn.close()
-        
+        cursor = self._cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            incident = self.create_incident(f"Alert: {message}", severity)
+
+            alert_id = secrets.token_hex(6)
+            cursor.execute(_SQL_INSERT_ALERT,
+                           (alert_id, alert_source, message, severity,
+                            datetime.now().isoformat(), incident.id))
+            cursor.execute('COMMIT')
+        except Exception:
+            cursor.execute('ROLLBACK')
+            raise
+
         return incident
     
     def generate_postmortem(self, incident_id: str) -> str:
         """Generate markdown postmortem template"""
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
+        cursor = self._cursor()
         cursor.execute(
-            'SELECT title, severity, assignee, timeline, created_at, resolved_at FROM incidents WHERE id = ?',
+            'SELECT title, severity, assignee, created_at, resolved_at FROM incidents WHERE id = ?',
             (incident_id,)
         )
         row = cursor.fetchone()
-        conn.close()
-        
+
         if not row:
             return ""
-        
-        title, severity, assignee, timeline_json, created_at, resolved_at = row
-        timeline = json.loads(timeline_json)
-        
-        postmortem = f"""# Incident Postmortem
+
+        title, severity, assignee, created_at, resolved_at = row
+        timeline = self._fetch_timeline(incident_id)
+
+        parts = [f"""# Incident Postmortem
 
 ## Summary
 - **Title:** {title}
@@ -267,11 +488,12 @@ class IncidentManager:
 - **Duration:** {created_at} to {resolved_at}
 
 ## Timeline
-"""
-        for event in timeline:
-            postmortem += f"- **{event['timestamp']}** ({event['author']}): {event['event']}\n"
-        
-        postmortem += """
+"""]
+        parts.extend(
+            f"- **{event['timestamp']}** ({event['author']}): {event['event']}\n"
+            for event in timeline
+        )
+        parts.append("""
 ## Root Cause Analysis
 <!-- Add root cause here -->
 
@@ -283,35 +505,23 @@ class IncidentManager:
 
 ## Lessons Learned
 <!-- Add lessons learned here -->
-"""
-        return postmortem
+""")
+        return "".join(parts)
     
     def oncall_schedule(self) -> str:
         """Get rotating on-call person based on day of week"""
-        from datetime import datetime
-        day_of_week = datetime.now().weekday()
-        return TEAM[day_of_week % len(TEAM)]
+        return _oncall_for_day(date.today().toordinal())
     
     def get_incident(self, incident_id: str) -> Optional[Incident]:
         """Get incident details"""
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute(
-            'SELECT id, title, severity, status, assignee, services, timeline, created_at, resolved_at, postmortem FROM incidents WHERE id = ?',
-            (incident_id,)
-        )
+        cursor = self._cursor()
+        cursor.execute(_SQL_SELECT_INCIDENT, (incident_id,))
         row = cursor.fetchone()
-        conn.close()
-        
+
         if not row:
             return None
-        
-        return Incident(
-            id=row[0], title=row[1], severity=row[2], status=row[3],
-            assignee=row[4], services=json.loads(row[5]),
-            timeline=json.loads(row[6]), created_at=row[7],
-            resolved_at=row[8], postmortem=row[9] or ""
-        )
+
+        return Incident._from_row(row, timeline=self._fetch_timeline(row["id"]))
 
 
 def main():